@@ -0,0 +1,80 @@
+"""Benchmarks forced alignment latency and accuracy drift for different AlignerConfig settings.
+
+Each config is warmed up once (model loading and quantization), then timed over the alignment
+stage as paid by a render with a warm model (acoustic model inference and the trellis search).
+Drift is measured against the default config.
+
+Run from the repository root:
+    python -m benchmarks.alignment
+"""
+
+import os
+import time
+import statistics
+
+from pytoon.audio import load_audio
+from pytoon.lipsync import AlignerConfig
+from pytoon.aligner import BufferedForceAlign, torch_threads
+
+# Constants
+TEXT_PATH = "./.test/speech.txt"  # Path to a transcript text file
+AUDIO_PATH = "./.test/speech.mp3"  # Path to an audio file of speech
+REPEATS = 3  # Number of timed runs per configuration
+THREADS = max(1, (os.cpu_count() or 2) // 2)  # Thread count for the tuned configurations
+
+CONFIGS = {
+    "default (fp32)": AlignerConfig(),
+    f"fp32, {THREADS} threads": AlignerConfig(num_threads=THREADS),
+    "int8": AlignerConfig(quantize=True),
+    f"int8, {THREADS} threads": AlignerConfig(num_threads=THREADS, quantize=True),
+    "fp32, no_grad": AlignerConfig(inference_mode=False),
+}
+
+
+def align(audio, transcript: str, config: AlignerConfig):
+    """Runs forced alignment once and returns the aligned words and the elapsed seconds"""
+    start = time.perf_counter()
+    with torch_threads(config):
+        aligner = BufferedForceAlign(audio=audio, transcript=transcript, config=config)
+        words = aligner.inference()
+    return words, time.perf_counter() - start
+
+
+def drift(words, reference) -> tuple:
+    """Mean and max absolute difference (ms) between the word boundaries of two alignments"""
+    if [word.word for word in words] != [word.word for word in reference]:
+        return None, None
+    deltas = []
+    for word, ref in zip(words, reference):
+        deltas.append(abs(word.time_start - ref.time_start))
+        deltas.append(abs(word.time_end - ref.time_end))
+    return statistics.mean(deltas) * 1000, max(deltas) * 1000
+
+
+def main():
+    with open(TEXT_PATH, "r") as file:
+        transcript = file.read()
+    audio = load_audio(AUDIO_PATH)
+    print(f"Audio Duration: {audio.duration:.2f}s, Repeats: {REPEATS}\n")
+
+    reference = None
+    print(f"{'config':<24}{'median (s)':>12}{'speedup':>10}{'mean drift (ms)':>18}{'max drift (ms)':>17}")
+    for name, config in CONFIGS.items():
+        align(audio, transcript, config)  # Warm up, loads (and quantizes) the acoustic model
+        timings = []
+        for _ in range(REPEATS):
+            words, elapsed = align(audio, transcript, config)
+            timings.append(elapsed)
+        median = statistics.median(timings)
+
+        if reference is None:
+            reference, reference_median = words, median
+        mean_drift, max_drift = drift(words, reference)
+        mean_drift = "n/a" if mean_drift is None else f"{mean_drift:.1f}"
+        max_drift = "n/a" if max_drift is None else f"{max_drift:.1f}"
+        speedup = reference_median / median
+        print(f"{name:<24}{median:>12.2f}{speedup:>9.2f}x{mean_drift:>18}{max_drift:>17}")
+
+
+if __name__ == "__main__":
+    main()
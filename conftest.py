@@ -0,0 +1 @@
+# Makes the pytoon package importable when the tests are run with plain `pytest` from the repo root
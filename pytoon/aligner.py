@@ -0,0 +1,116 @@
+from forcealign import ForceAlign
+from forcealign.transcriber import GreedyCTCDecoder
+from forcealign.utils import alphabetical
+from contextlib import contextmanager
+import torch
+import torchaudio
+
+from .audio import AudioBuffer
+from .lipsync import AlignerConfig, get_breath_idx
+
+# Acoustic models kept in memory between alignments, keyed by (bundle, device, quantized)
+ACOUSTIC_MODELS = {}
+
+
+@contextmanager
+def torch_threads(config: AlignerConfig):
+    """Limits the torch thread pools while aligning, restoring the intra-op thread count afterwards.
+
+    Args:
+        config (AlignerConfig): Aligner settings with the requested thread counts
+    """
+    previous_threads = torch.get_num_threads()
+    if config.num_threads:
+        torch.set_num_threads(config.num_threads)
+    if config.num_interop_threads and torch.get_num_interop_threads() != config.num_interop_threads:
+        try:
+            torch.set_num_interop_threads(config.num_interop_threads)
+        except RuntimeError:
+            # torch only allows this before any inter-op parallel work has started
+            print(f"Could not set inter-op threads, using {torch.get_num_interop_threads()}")
+    try:
+        yield
+    finally:
+        torch.set_num_threads(previous_threads)
+
+
+def get_acoustic_model(bundle, device: torch.device, quantize: bool = False):
+    """Loads the acoustic model of a torchaudio bundle once per process and reuses it afterwards
+
+    Args:
+        bundle: torchaudio wav2vec2 pipeline bundle
+        device (torch.device): Device to run the model on
+        quantize (bool, optional): Dynamically quantize the model's linear layers to int8 (CPU only).
+
+    Returns:
+        torch.nn.Module: The acoustic model in eval mode
+    """
+    if quantize and device.type != "cpu":
+        print(f"Skipping int8 quantization, it is only supported on CPU (device: {device})")
+        quantize = False
+
+    key = (id(bundle), device.type, quantize)
+    if key not in ACOUSTIC_MODELS:
+        model = bundle.get_model().to(device).eval()
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        ACOUSTIC_MODELS[key] = model
+    return ACOUSTIC_MODELS[key]
+
+
+class BufferedForceAlign(ForceAlign):
+    """ForceAlign that reads its audio from a shared AudioBuffer instead of decoding the file again."""
+
+    def __init__(
+        self,
+        audio: AudioBuffer,
+        transcript: str = None,
+        config: AlignerConfig = None,
+        seed=None,
+    ):
+        # Mirrors ForceAlign.__init__ of forcealign 1.1.x (pinned in setup.py), but reuses a warm acoustic
+        # model instead of loading it per alignment and places breaths with the given seed
+        self.audio = audio
+        self.config = config or AlignerConfig()
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.SPEECH_FILE = audio.path
+        self.bundle = torchaudio.pipelines.WAV2VEC2_ASR_BASE_960H
+        self.model = get_acoustic_model(self.bundle, self.device, quantize=self.config.quantize)
+        self.labels = self.bundle.get_labels()
+        self.dictionary = {c: i for i, c in enumerate(self.labels)}
+
+        self._load_audio()
+
+        if transcript is None:
+            print("No transcript provided. Generating transcript from the emissions...")
+            self.raw_text = self.transcribe()
+            print(f"Generated Transcript: {self.raw_text}")
+        else:
+            self.raw_text = transcript
+
+        text = alphabetical(self.raw_text).upper().split()
+        self.transcript = f'{"|".join(text)}|'
+        self.tokens = [self.dictionary[c] for c in self.transcript]
+        self.breath_idx = get_breath_idx(self.raw_text, seed=seed)
+        self.word_alignments = None
+        self.phoneme_alignments = []
+
+    def _load_audio(self):
+        """Resamples the shared audio for the acoustic model and computes emissions."""
+        grad_mode = torch.inference_mode() if self.config.inference_mode else torch.no_grad()
+        with grad_mode:
+            waveform = self.audio.mono(target_sr=self.bundle.sample_rate)
+            self.waveform = torch.from_numpy(waveform).unsqueeze(0)
+
+            self.emissions, _ = self.model(self.waveform.to(self.device))
+            self.emissions = torch.log_softmax(self.emissions, dim=-1)
+            self.emission = self.emissions[0].cpu().detach()
+
+    def transcribe(self) -> str:
+        """Greedy CTC decode of the emissions already computed for alignment (same as forcealign.speech_to_text)
+
+        Returns:
+            str: Transcribed text
+        """
+        decoder = GreedyCTCDecoder(labels=self.labels)
+        return decoder(self.emission).replace("|", " ").strip()
@@ -7,11 +7,13 @@ from datetime import datetime
 import numpy as np
 import cv2
 import copy
-from moviepy.editor import ImageSequenceClip, CompositeVideoClip, CompositeAudioClip, AudioFileClip, VideoClip
+from moviepy.editor import ImageSequenceClip, CompositeVideoClip, CompositeAudioClip, VideoClip
 
 from .util import read_json
-from .dataloader import get_assets
-from .lipsync import viseme_sequencer, upsample
+from .audio import load_audio
+from .dataloader import Emotions, get_assets
+from .lipsync import AlignerConfig, viseme_sequencer, upsample
+from .segments import SegmentCache, split_segments, segment_key, plan_fingerprint, content_hash, relative_asset
 
 
 class FrameSequence:
@@ -26,60 +28,114 @@ class FrameSequence:
 
 
 class animate:
-    """Animates a cartoon that is lip synced to provieded audio voiceover."""
+    """Animates a cartoon that is lip synced to provieded audio voiceover.
 
-    def __init__(self, audio_file: str, transcript: str = None, fps: int = 48):
+    Args:
+        audio_file (str): Path to audio file of a person speaking english (.wav or .mp3)
+        transcript (str): (optional) Trascript string of audio recording
+        fps (int): Frame rate of the animation
+        cache_dir (str): (optional) Directory for rendered segments. When provided, the animation is
+            rendered incrementally and only segments whose inputs changed are rendered again.
+        seed: Seed for every random choice of the animation (breaths, frame rounding and poses). The same
+            inputs and seed always produce the same frames. Pass None for a different animation every time.
+        mmap_audio (bool): Memory-map the decoded audio instead of holding it in memory (long recordings)
+        aligner_config (AlignerConfig): (optional) CPU thread counts, int8 quantization and grad mode
+            used by forced alignment
+        assets (Emotions): (optional) Character asset set, defaults to the built-in character
+        render_frames (bool): Render the frames of the animation. When False only the frame plan
+            (pose, mouth and coordinate sequences) is built, e.g. for rendering in a scene.
+    """
+
+    def __init__(
+        self,
+        audio_file: str,
+        transcript: str = None,
+        fps: int = 48,
+        cache_dir: str = None,
+        seed=0,
+        mmap_audio: bool = False,
+        aligner_config: AlignerConfig = None,
+        assets: Emotions = None,
+        render_frames: bool = True,
+    ):
         self.audio_file = audio_file
+        # Decode the audio once and share it between alignment and export
+        self.audio = load_audio(audio_file, mmap=mmap_audio)
         self.sequence = FrameSequence()
-        self.assets = get_assets()
+        self.assets = assets if assets is not None else get_assets()
         self.fps = fps
         self.final_frames = []
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.cache = SegmentCache(cache_dir) if cache_dir else None
 
         # Initialize blinking rate (blink every 3 seconds)
         self.blink_rate = 3.0
 
         # Create sequence of mouth images
-        self.viseme_sequence = viseme_sequencer(self.audio_file, transcript, self.fps)
+        self.viseme_sequence = viseme_sequencer(self.audio, transcript, self.fps, aligner_config, seed=self.seed)
         self.build_mouth_sequence()
 
         self.duration = len(self.sequence.mouth_files) / self.fps
         print(f"Num Created: {len(self.sequence.mouth_files)}")
         print(f"Duration: {self.duration}")
 
-        self.build_pose_sequence()
+        if self.cache:
+            self.segments = split_segments(self.sequence.pose_changes)
+            self.build_segment_pose_sequence()
+        else:
+            self.build_pose_sequence()
 
         self.frame_size = self.get_frame_size()
         # Create the animation
-        self.compile_animation()
+        if render_frames:
+            self.compile_animation()
 
     def build_pose_sequence(self):
         """Creates the sequence of pose images for the video"""
         emotion = self.random_emotion()
-        pose = random.choice(emotion)
+        pose = self.rng.choice(emotion)
 
         # Add a character pose frame for every frame of a mouth
         for i, _ in enumerate(self.sequence.mouth_files):
             if self.sequence.pose_changes[i]:
                 # Change the pose of the character
                 emotion = self.random_emotion()
-                pose = random.choice(emotion)
+                pose = self.rng.choice(emotion)
 
             eyes = self.blink_manager(idx=i)
             self.sequence.pose_files.append(pose.image_files[eyes])
             self.sequence.mouth_coords.append(pose.mouth_coordinates)
-
-        # Prepend absolute path to all pose images
-        self.sequence.pose_files = [f"{os.path.dirname(__file__)}{file}" for file in self.sequence.pose_files]
-
-        # Create mouth PIL image for every frame, with image transformations based on pose
-        for i, _ in enumerate(self.sequence.mouth_files):
-            transformed_image = mouth_transformation(
-                mouth_file=self.sequence.mouth_files[i],
-                mouth_coord=self.sequence.mouth_coords[i],
-            )
-            self.sequence.mouth_images.append(transformed_image)
         return
 
+    def build_segment_pose_sequence(self):
+        """Creates the sequence of pose images for the video one segment at a time.
+        The pose of each segment only depends on its own mouth sequence and the seed (if any), and
+        blinking restarts with each segment, so editing one part of the transcript does not
+        change the frames of any other segment.
+        """
+        for segment in self.segments:
+            mouth_files = self.sequence.mouth_files[segment.start : segment.end]
+            if self.seed is None:
+                # Unseeded animations pick a different pose every time
+                rng = self.rng
+            else:
+                # Seeded by the mouth sequence itself (not the image contents), so editing an asset keeps the pose
+                mouths = [relative_asset(f) for f in mouth_files]
+                rng = random.Random(content_hash({"mouths": mouths, "seed": self.seed}))
+            emotion = getattr(self.assets, rng.choice(list(self.assets.__dict__.keys())))
+            pose = rng.choice(emotion)
+
+            pose_files = []
+            for i in range(segment.length):
+                eyes = self.blink_manager(idx=i)
+                pose_files.append(pose.image_files[eyes])
+            mouth_coords = [pose.mouth_coordinates] * segment.length
+
+            segment.key = segment_key(mouth_files, pose_files, mouth_coords, self.fps, self.seed)
+            self.sequence.pose_files.extend(pose_files)
+            self.sequence.mouth_coords.extend(mouth_coords)
+
     def blink_manager(self, idx):
 
         BLINK_DURATION = 0.16
@@ -136,15 +192,43 @@ class animate:
             list[Pose]: List of poses from a random emotion
         """
         emotions_list = list(self.assets.__dict__.keys())
-        emotion = random.choice(emotions_list)
+        emotion = self.rng.choice(emotions_list)
         return getattr(self.assets, emotion)
 
+    def fingerprint(self) -> str:
+        """Creates a stable hash of the frame plan (pose, mouth and coordinates of every frame), fps and audio.
+            Animations with the same fingerprint render the same character frames and audio. It does not
+            cover the background, scale or position passed to export.
+
+        Returns:
+            str: Hex digest of the animation
+        """
+        return plan_fingerprint(
+            mouth_files=self.sequence.mouth_files,
+            pose_files=self.sequence.pose_files,
+            mouth_coords=self.sequence.mouth_coords,
+            fps=self.fps,
+            audio_digest=self.audio.digest(),
+        )
+
     def get_frame_size(self):
         pose_image = cv2.imread(self.sequence.pose_files[0])
         height, width, _ = pose_image.shape
         return (width, height)
 
     def compile_animation(self):
+        if self.cache:
+            self.compile_segments()
+            return
+
+        # Create mouth PIL image for every frame, with image transformations based on pose
+        for i, _ in enumerate(self.sequence.mouth_files):
+            transformed_image = mouth_transformation(
+                mouth_file=self.sequence.mouth_files[i],
+                mouth_coord=self.sequence.mouth_coords[i],
+            )
+            self.sequence.mouth_images.append(transformed_image)
+
         for i, _ in enumerate(self.sequence.pose_files):
             frame = cv2.imread(self.sequence.pose_files[i], cv2.IMREAD_UNCHANGED)
             if self.sequence.mouth_files[i] is not None:
@@ -157,6 +241,29 @@ class animate:
                 final_frame = frame
             self.final_frames.append(final_frame)
 
+    def compile_segments(self):
+        """Compiles the animation from cached segments, rendering only the segments that changed"""
+        for segment in self.segments:
+            frames = self.cache.load(segment.key)
+            if frames is None:
+                frames = []
+                for i in range(segment.start, segment.end):
+                    frame = cv2.imread(self.sequence.pose_files[i], cv2.IMREAD_UNCHANGED)
+                    if self.sequence.mouth_files[i] is not None:
+                        mouth_img = mouth_transformation(
+                            mouth_file=self.sequence.mouth_files[i],
+                            mouth_coord=self.sequence.mouth_coords[i],
+                        )
+                        frame = render_frame(
+                            pose_img=frame,
+                            mouth_img=mouth_img,
+                            mouth_coord=self.sequence.mouth_coords[i],
+                        )
+                    frames.append(frame)
+                self.cache.save(segment.key, frames)
+            self.final_frames.extend(frames)
+        print(f"Segments Reused: {self.cache.hits}/{len(self.segments)}")
+
     def export(self, path: str, background: VideoClip, scale: float = 0.7):
         animation_clip = ImageSequenceClip(self.final_frames, fps=self.fps, with_mask=True)
         new_height = int(background.size[1] * scale)
@@ -169,13 +276,19 @@ class animate:
         )
 
         # Add speech audio to clip with 0.2 second delay
-        audio_clip = AudioFileClip(self.audio_file)
+        audio_clip = self.audio.to_clip()
         audio_clip = CompositeAudioClip([audio_clip.set_start(0.2)])
         final_clip = final_clip.set_audio(audio_clip)
 
         # Export video to .mp4
         final_clip.write_videofile(
-            path, codec="libx264", audio_codec="aac", preset="ultrafast", threads=4, fps=self.fps
+            path,
+            codec="libx264",
+            audio_codec="aac",
+            audio_fps=self.audio.sample_rate,
+            preset="ultrafast",
+            threads=4,
+            fps=self.fps,
         )
 
 
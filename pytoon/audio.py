@@ -0,0 +1,285 @@
+import os
+import shutil
+import weakref
+import hashlib
+import tempfile
+import subprocess
+from math import gcd
+from typing import Union
+
+import numpy as np
+from scipy.io import wavfile
+from scipy.signal import resample_poly
+
+# Number of input samples processed at once when mixing down or resampling
+CHUNK_SIZE = 1 << 18
+
+
+class AudioBuffer:
+    """Decoded audio shared by every stage of a render (alignment, muxing, etc.).
+
+    Args:
+        path (str): Path to the audio file the samples were decoded from
+        samples (np.ndarray): PCM samples with shape (num_samples, num_channels), may be memory-mapped
+        sample_rate (int): Sample rate of the samples
+        temp_files (list, optional): Decoded files or dirs backing memory-mapped samples, removed by close()
+            or once the buffer is garbage collected
+    """
+
+    def __init__(self, path: str, samples: np.ndarray, sample_rate: int, temp_files: list = None):
+        self.path = path
+        self.samples = samples if samples.ndim == 2 else samples[:, np.newaxis]
+        self.sample_rate = sample_rate
+        self._finalizer = weakref.finalize(self, remove_files, list(temp_files or []))
+
+    def close(self) -> None:
+        """Releases the samples and removes any temporary files backing them"""
+        self.samples = self.samples[:0].copy()
+        self._finalizer()
+
+    @property
+    def num_channels(self) -> int:
+        return self.samples.shape[1]
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.sample_rate
+
+    def digest(self) -> str:
+        """Hashes the decoded samples (in chunks, so memory-mapped audio is never fully loaded)
+
+        Returns:
+            str: Hex digest of the sample rate, format and samples of the audio
+        """
+        sha = hashlib.sha256(f"{self.sample_rate}:{self.samples.dtype.str}:{self.samples.shape}".encode())
+        for start in range(0, len(self.samples), CHUNK_SIZE):
+            sha.update(np.ascontiguousarray(self.samples[start : start + CHUNK_SIZE]).tobytes())
+        return sha.hexdigest()
+
+    def mono(self, target_sr: int = None) -> np.ndarray:
+        """Mixes the audio down to a single float32 channel in [-1, 1]
+
+        Args:
+            target_sr (int, optional): Resamples the audio to this sample rate if provided.
+
+        Returns:
+            np.ndarray: 1-D array of float32 samples
+        """
+        mono = np.empty(len(self.samples), dtype=np.float32)
+        # Mix down in blocks so memory-mapped audio is never fully copied at its native width
+        for start in range(0, len(self.samples), CHUNK_SIZE):
+            block = to_float(self.samples[start : start + CHUNK_SIZE])
+            mono[start : start + len(block)] = block.mean(axis=1)
+
+        if target_sr and target_sr != self.sample_rate:
+            mono = resample_chunked(mono, orig_sr=self.sample_rate, target_sr=target_sr)
+        return mono
+
+    def resample(self, target_sr: int) -> "AudioBuffer":
+        """Resamples every channel with a polyphase filter (see resample_chunked)
+
+        Args:
+            target_sr (int): Target sample rate
+
+        Returns:
+            AudioBuffer: The resampled float32 audio in [-1, 1], or this buffer if it already has the target rate
+        """
+        if target_sr == self.sample_rate:
+            return self
+        # Resampling is linear, so integer PCM is resampled in chunks first and scaled to [-1, 1] afterwards
+        samples = to_float(self.samples) if self.samples.dtype == np.uint8 else self.samples
+        resampled = resample_chunked(samples, orig_sr=self.sample_rate, target_sr=target_sr)
+        if np.issubdtype(samples.dtype, np.integer):
+            resampled /= -float(np.iinfo(samples.dtype).min)
+        return AudioBuffer(path=self.path, samples=resampled, sample_rate=target_sr)
+
+    def to_clip(self):
+        """Wraps the buffer in a MoviePy audio clip without decoding the audio file again
+
+        Returns:
+            AudioClip: MoviePy audio clip that reads samples from the buffer on demand
+        """
+        from moviepy.audio.AudioClip import AudioClip
+
+        samples = self.samples
+        last = len(samples) - 1
+
+        def make_frame(t):
+            idx = np.round(np.asarray(t) * self.sample_rate).astype(np.int64)
+            frame = to_float(samples[np.clip(idx, 0, last)])
+            # Silence for any time outside of the recording
+            frame[(idx < 0) | (idx > last)] = 0
+            return frame
+
+        return AudioClip(make_frame=make_frame, duration=self.duration, fps=self.sample_rate)
+
+
+def load_audio(audio_file: str, mmap: bool = False, cache_dir: str = None) -> AudioBuffer:
+    """Decodes an audio file once into a buffer that can be shared by the whole pipeline
+
+    Args:
+        audio_file (str): Path to an audio file (.wav or .mp3)
+        mmap (bool, optional): Memory-map the decoded samples instead of loading them into memory.
+        cache_dir (str, optional): Directory to keep decoded .wav files in. Defaults to a temp dir.
+
+    Returns:
+        AudioBuffer: The decoded audio
+    """
+    if not os.path.exists(audio_file):
+        raise FileNotFoundError(f"Audio file not found: {audio_file}")
+
+    if audio_file.lower().endswith(".wav"):
+        try:
+            sample_rate, samples = read_wav(audio_file, mmap=mmap)
+            return AudioBuffer(path=audio_file, samples=samples, sample_rate=sample_rate)
+        except ValueError:
+            # scipy only reads PCM and float .wav files, decode any other codec (e.g. A-law) with ffmpeg
+            pass
+
+    # Decode compressed audio to .wav with ffmpeg, a memory-mapped buffer keeps the .wav file until it is closed
+    temp_dir = cache_dir or tempfile.mkdtemp(prefix="pytoon_")
+    os.makedirs(temp_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(audio_file))[0]
+    fd, wav_file = tempfile.mkstemp(prefix=f"{name}.", suffix=".wav", dir=temp_dir)
+    os.close(fd)
+    temp_files = [wav_file] if cache_dir else [temp_dir]
+    try:
+        decode_to_wav(audio_file, wav_file)
+        sample_rate, samples = read_wav(wav_file, mmap=mmap)
+    except BaseException:
+        remove_files(temp_files)
+        raise
+    if not mmap:
+        remove_files(temp_files)
+        temp_files = []
+    return AudioBuffer(path=audio_file, samples=samples, sample_rate=sample_rate, temp_files=temp_files)
+
+
+def audio_duration(audio_file: str) -> float:
+    """Reads the duration of an audio file (seconds) without decoding it"""
+    if audio_file.lower().endswith(".wav"):
+        try:
+            sample_rate, samples = read_wav(audio_file, mmap=True)
+            return len(samples) / sample_rate
+        except ValueError:
+            # Not a PCM or float .wav file, let ffmpeg read it
+            pass
+
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+    return ffmpeg_parse_infos(audio_file)["duration"]
+
+
+def remove_files(paths: list) -> None:
+    """Removes temporary files and directories, ignoring any that are already gone"""
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                # e.g. still memory-mapped on Windows
+                pass
+
+
+def read_wav(wav_file: str, mmap: bool = False) -> tuple:
+    """Reads a .wav file, memory-mapping it when possible"""
+    if mmap:
+        try:
+            return wavfile.read(wav_file, mmap=True)
+        except ValueError:
+            # scipy can not memory-map some formats (e.g. 24-bit PCM)
+            pass
+    return wavfile.read(wav_file)
+
+
+def decode_to_wav(audio_file: str, wav_file: str) -> None:
+    """Decodes any ffmpeg readable audio file to 16-bit PCM .wav"""
+    import imageio_ffmpeg
+
+    command = [
+        imageio_ffmpeg.get_ffmpeg_exe(),
+        "-y",
+        "-loglevel",
+        "error",
+        "-i",
+        audio_file,
+        "-vn",
+        "-acodec",
+        "pcm_s16le",
+        wav_file,
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to decode {audio_file}: {result.stderr.decode(errors='ignore')}")
+
+
+def to_float(samples: np.ndarray) -> np.ndarray:
+    """Converts PCM samples of any wav dtype to float32 in [-1, 1]"""
+    if samples.dtype == np.uint8:
+        return (samples.astype(np.float32) - 128) / 128
+    if np.issubdtype(samples.dtype, np.integer):
+        return samples.astype(np.float32) / -float(np.iinfo(samples.dtype).min)
+    return samples.astype(np.float32)
+
+
+def resample_chunked(
+    samples: np.ndarray,
+    orig_sr: int,
+    target_sr: int,
+    chunk_size: int = CHUNK_SIZE,
+    out: np.ndarray = None,
+) -> np.ndarray:
+    """Resamples audio with a polyphase filter, one chunk at a time.
+        Every chunk is padded with enough neighbouring samples to cover the filter, so the
+        output matches scipy.signal.resample_poly over the full signal while memory use is
+        bounded by the chunk size rather than the length of the recording.
+
+    Args:
+        samples (np.ndarray): Audio samples, resampled along the first axis
+        orig_sr (int): Sample rate of the samples
+        target_sr (int): Target sample rate
+        chunk_size (int, optional): Approximate number of input samples per chunk.
+        out (np.ndarray, optional): Preallocated (e.g. memory-mapped) output array.
+
+    Returns:
+        np.ndarray: The resampled float32 audio
+    """
+    divisor = gcd(int(orig_sr), int(target_sr))
+    up = int(target_sr) // divisor
+    down = int(orig_sr) // divisor
+    num_samples = len(samples)
+    num_out = -(-num_samples * up // down)
+
+    if out is None:
+        out = np.empty((num_out,) + samples.shape[1:], dtype=np.float32)
+    if up == down:
+        out[:] = samples
+        return out
+
+    # resample_poly's filter spans 10 * max(up, down) upsampled samples on either side
+    half_len = 10 * max(up, down)
+    pad = -(-half_len // up) + 1
+    # Chunks and padding start on multiples of 'down' so every chunk maps onto whole output samples
+    pad = -(-pad // down) * down
+    chunk_size = max(down, chunk_size // down * down)
+
+    for start in range(0, num_samples, chunk_size):
+        end = min(start + chunk_size, num_samples)
+        pad_left = min(pad, start)
+        chunk = samples[start - pad_left : end + pad]
+        resampled = resample_poly(chunk.astype(np.float32), up, down, axis=0)
+
+        out_start = start * up // down
+        out_count = min(-(-(end - start) * up // down), num_out - out_start)
+        offset = pad_left * up // down
+        out[out_start : out_start + out_count] = resampled[offset : offset + out_count]
+    return out
+
+
+def as_audio_buffer(audio: Union[str, AudioBuffer]) -> AudioBuffer:
+    """Returns the audio as an AudioBuffer, decoding it if a file path was given"""
+    if isinstance(audio, AudioBuffer):
+        return audio
+    return load_audio(audio)
@@ -1,6 +1,7 @@
 from dataclasses import dataclass
 from .util import read_json
 from copy import deepcopy
+import os
 
 
 @dataclass
@@ -19,7 +20,7 @@ class MouthCoordinates:
 class Pose:
     """Data class for storing data for specific character poses."""
 
-    image_files: dict  # Dictionary containing paths to variations of the pose image.
+    image_files: dict  # Dictionary containing absolute paths to variations of the pose image.
     mouth_coordinates: MouthCoordinates  # Mouth coordinates / transformations.
 
 
@@ -40,7 +41,7 @@ def get_assets() -> Emotions:
     """Loads pose data from json file and returns as a dictionary.
 
     Returns:
-        dict: Pose data, including paths to images, emotion specific poses, and mouth coords.
+        dict: Pose data, including absolute paths to images, emotion specific poses, and mouth coords.
     """
     pose_data = read_json(file="pose_data.json")["emotions"]
 
@@ -49,7 +50,11 @@ def get_assets() -> Emotions:
         if emotion not in ["sad", "angry", "confused"]:
             poses = []
             for i, _ in enumerate(pose_data[emotion]):
-                images = deepcopy(pose_data[emotion][i]["image_files"])
+                # Built-in images are stored relative to the package (/assets/...)
+                images = {
+                    eyes: f"{os.path.dirname(__file__)}{file}"
+                    for eyes, file in pose_data[emotion][i]["image_files"].items()
+                }
                 coords = deepcopy(pose_data[emotion][i]["mouth_coordinates"])
                 pose = {
                     "image_files": images,
@@ -1,5 +1,5 @@
-from forcealign import ForceAlign
 from .util import read_json
+from .audio import AudioBuffer, as_audio_buffer
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Union
@@ -13,6 +13,8 @@ SILENT_PHONEME = "PAUSE"
 PHONEMES = read_json("phonemes.json")
 # Simplified phonemes to viseme-sequence mapping
 VISEMES = read_json("visemes.json")
+# Closed mouth silence added to the end of every animation
+ENDING_SILENCE_SECONDS = 2.5
 
 
 @dataclass
@@ -27,24 +29,104 @@ class WordViseme:
     breath: bool
 
 
-def viseme_sequencer(audio_file: str, transcript: str = None, fps: int = 48) -> list[WordViseme]:
+@dataclass
+class AlignerConfig:
+    """Data class for CPU inference settings of the forced alignment stage"""
+
+    num_threads: int = None  # Intra-op threads used by torch (None keeps torch's default)
+    num_interop_threads: int = None  # Inter-op threads, can only be set once per process
+    quantize: bool = False  # Dynamic int8 quantization of the acoustic model's linear layers (CPU only)
+    inference_mode: bool = True  # Run the model under torch.inference_mode instead of torch.no_grad
+
+
+def keyed_rng(seed, *key):
+    """Creates a random number generator for a single decision, seeded by the seed and the decision's content.
+        Each word and pause draws from its own generator, so editing one part of a transcript does not
+        change the random choices made anywhere else.
+
+    Args:
+        seed: Seed of the animation, None draws from the global random number generator instead
+        key: Content that identifies the decision (e.g. word, phonemes and duration)
+
+    Returns:
+        random.Random: Seeded random number generator (or the global random module if seed is None)
+    """
+    if seed is None:
+        return random
+    return random.Random("|".join(str(part) for part in (seed,) + key))
+
+
+def get_breath_idx(transcript: str, seed=None) -> list[int]:
+    """Detects the indices of words that are likely preceded by a breath (i.e. a pose change).
+        Same rules as forcealign.utils.get_breath_idx, but every choice is seeded by its own words.
+
+    Args:
+        transcript (str): Transcript with punctuation
+        seed: (optional) Seed of the animation, defaults to the global random number generator
+
+    Returns:
+        list[int]: Indices of the words after a comma and after some of the periods
+    """
+    transcript = re.sub(r"[^a-zA-Z\s,.]", "", transcript.replace("—", " "))
+    words = transcript.upper().split()
+    idxs = []
+    for i in range(len(words) - 1):
+        if "," in words[i]:
+            idxs.append(i + 1)
+        elif "." in words[i] and keyed_rng(seed, "breath", words[i], words[i + 1]).choice([True, False, False]):
+            idxs.append(i + 1)
+    return idxs
+
+
+def viseme_sequencer(
+    audio_file: Union[str, AudioBuffer],
+    transcript: str = None,
+    fps: int = 48,
+    aligner_config: AlignerConfig = None,
+    seed=None,
+) -> list[WordViseme]:
     """Converts and audio / txt file to force aligned viseme sequence
 
     Args:
-        audio_file (str): Path to audio file of a person speaking english (.wav or .mp3)
+        audio_file (str | AudioBuffer): Path to audio file of a person speaking english (.wav or .mp3),
+            or audio that has already been decoded with pytoon.audio.load_audio
         transcript (str): (optional) Trascript string of audio recording
             - If not transcript is provided, it will automatically detect with speech to text
+        fps (int): Frame rate of the animation
+        aligner_config (AlignerConfig): (optional) Thread, quantization and grad mode settings for alignment
+        seed: (optional) Seed for breaths and frame rounding. The same inputs and seed always produce
+            the same viseme sequence. Defaults to the global random number generator.
 
     Returns:
         list[WordViseme]: A list of force aligned WordViseme objects
     """
-    ENDING_SILENCE_SECONDS = 2.5
-    # Provide path to audio_file and corresponding txt_file with audio transcript
-    aligner = ForceAlign(audio_file=audio_file, transcript=transcript)
+    # Imported here so the sequencing below can be used without loading torch
+    from .aligner import BufferedForceAlign, torch_threads
+
+    aligner_config = aligner_config or AlignerConfig()
+    with torch_threads(aligner_config):
+        # Provide path to audio_file and corresponding txt_file with audio transcript
+        aligner = BufferedForceAlign(
+            audio=as_audio_buffer(audio_file), transcript=transcript, config=aligner_config, seed=seed
+        )
+
+        # Runs forced alignment algorithm and returns alignment results
+        words = aligner.inference()
+
+    return sequence_words(words, fps=fps, seed=seed)
 
-    # Runs forced alignment algorithm and returns alignment results
-    words = aligner.inference()
 
+def sequence_words(words: list, fps: int = 48, seed=None) -> list[WordViseme]:
+    """Converts force aligned words to a viseme sequence
+
+    Args:
+        words (list[forcealign.Word]): Force aligned words
+        fps (int): Frame rate of the animation
+        seed: (optional) Seed for frame rounding, defaults to the global random number generator
+
+    Returns:
+        list[WordViseme]: A list of force aligned WordViseme objects, with pauses and ending silence
+    """
     first_word = words[0]
     print(f"Time Start: {first_word.time_start}")
     last_word = words[-1]
@@ -58,14 +140,16 @@ def viseme_sequencer(audio_file: str, transcript: str = None, fps: int = 48) ->
         phonemes = [phoneme_no_stress(phoneme) for phoneme in word.phonemes]
         images = [phoneme_to_viseme(phoneme=phoneme) for phoneme in phonemes]
         duration = word.time_end - word.time_start
-        total_frames = int((duration / total_duration) * target_frames)
+        # Frames only depend on the word itself, so edits elsewhere never shift its frame count
+        rng = keyed_rng(seed, "word", word.word, phonemes, round(duration, 3))
+        total_frames = int(duration * fps)
 
-        remainder = ((duration / total_duration) * target_frames) % 1
-        if random.choices([True, False], [remainder, (1 - remainder)])[0]:
+        remainder = (duration * fps) % 1
+        if rng.choices([True, False], [remainder, (1 - remainder)])[0]:
             total_frames += 1
 
         # If viseme is more than one frame long
-        visemes = generate_viseme_frames(sequence=images, total_frames=total_frames)
+        visemes = generate_viseme_frames(sequence=images, total_frames=total_frames, rng=rng)
         total_frames = len(visemes)
 
         viseme_sequence.append(
@@ -88,30 +172,34 @@ def viseme_sequencer(audio_file: str, transcript: str = None, fps: int = 48) ->
         if i == len(viseme_sequence) - 1:
             break
 
-        silent_viseme = get_silent_viseme(viseme_sequence[i], viseme_sequence[i + 1], total_duration, target_frames)
+        current_viseme, next_viseme = viseme_sequence[i], viseme_sequence[i + 1]
+        pause = round(next_viseme.time_start - current_viseme.time_end, 3)
+        rng = keyed_rng(seed, "pause", current_viseme.word, next_viseme.word, pause)
+        silent_viseme = get_silent_viseme(current_viseme, next_viseme, fps, rng=rng)
         if silent_viseme:
             finished_sequence.append(silent_viseme)
 
-    finshed_sequence = upsample(finished_sequence, length=target_frames)
     silence = ending_silence(duration=ENDING_SILENCE_SECONDS, fps=fps, start_t=total_duration + 0.001)
     finished_sequence.append(silence)
     return finished_sequence
 
 
-def generate_viseme_frames(sequence: list, total_frames: int) -> list:
+def generate_viseme_frames(sequence: list, total_frames: int, rng: random.Random = None) -> list:
     """Generates the complete viseme frame sequence for word viseme
 
     Args:
         sequence (list): List of visemes in word
         total_frames (int): Total frames allocated to full word
+        rng (random.Random): (optional) Random number generator, defaults to the global one
 
     Returns:
         list: Completed viseme video sequence of images for word
     """
     frames_per_subviseme = total_frames // len(sequence)
     remainder_end = total_frames % len(sequence)
+    rng = rng or random
     if frames_per_subviseme == 0:
-        if random.choice([True, False]):
+        if rng.choice([True, False]):
             frames_per_subviseme = 1
         else:
             return []
@@ -178,7 +266,7 @@ def phoneme_to_viseme(phoneme: str) -> list[str]:
     return viseme
 
 
-def get_silent_viseme(current_viseme, next_viseme, total_duration, target_frames):
+def get_silent_viseme(current_viseme, next_viseme, fps: int, rng: random.Random = None):
     # The time the silent viseme should start after previous viseme (i.e. the next frame)
     delta = 0.00000000000000000001
 
@@ -187,10 +275,11 @@ def get_silent_viseme(current_viseme, next_viseme, total_duration, target_frames
     silence_end = next_viseme.time_start - delta
     duration = silence_end - silence_start
 
-    # Get number of frames for silence segment (24 frames per second of silence)
-    total_frames = int((duration / total_duration) * target_frames)
-    remainder = ((duration / total_duration) * target_frames) % 1
-    if random.choices([True, False], [remainder, (1 - remainder)])[0]:
+    # Get number of frames for silence segment
+    total_frames = int(duration * fps)
+    remainder = (duration * fps) % 1
+    rng = rng or random
+    if rng.choices([True, False], [remainder, (1 - remainder)])[0]:
         total_frames += 1
 
     # Create frames for silence
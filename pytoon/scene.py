@@ -0,0 +1,208 @@
+from collections import OrderedDict
+from dataclasses import dataclass, astuple
+
+import numpy as np
+from PIL import Image
+from moviepy.editor import ImageSequenceClip, CompositeVideoClip, CompositeAudioClip, VideoClip
+
+from .animator import animate, mouth_transformation
+from .dataloader import Emotions
+from .lipsync import AlignerConfig
+from .segments import content_hash
+
+
+@dataclass
+class Track:
+    """Data class for one character of a scene and the audio it lip syncs to.
+    Custom asset sets only replace the poses: mouths are always drawn from the built-in
+    viseme images (assets/visemes/positive), placed with each pose's mouth coordinates.
+    """
+
+    audio_file: str  # Path to audio file of the character speaking english (.wav or .mp3)
+    transcript: str = None  # Transcript of the audio, generated with speech to text if None
+    assets: Emotions = None  # Character asset set, defaults to the built-in character
+    position: tuple = (0, 0)  # (x, y) of the character's top left corner on the scene canvas (pxls)
+
+
+class AssetCache:
+    """Decoded pose, mouth and character images shared by every track of a scene.
+    Pose and character frames are full size RGBA images (~4MB each for the built-in character),
+    so they are kept in a single LRU cache bounded by bytes.
+
+    Args:
+        max_bytes (int): Memory (bytes) of the pose and character frames to keep. The default (512MB) holds
+            ~128 frames, enough for the 3 eye states x 11 mouth shapes of a few poses on screen at once.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024**2):
+        self.mouths = {}
+        self.frames = OrderedDict()
+        self.max_bytes = max_bytes
+        self.bytes = 0
+
+    def pose(self, pose_file: str) -> Image:
+        key = ("pose", pose_file)
+        if key not in self.frames:
+            with Image.open(pose_file) as image:
+                self.store(key, image.convert("RGBA"))
+        return self.load(key)
+
+    def mouth(self, mouth_file: str, mouth_coord) -> Image:
+        key = (mouth_file, astuple(mouth_coord))
+        if key not in self.mouths:
+            self.mouths[key] = mouth_transformation(mouth_file=mouth_file, mouth_coord=mouth_coord)
+        return self.mouths[key]
+
+    def character(self, pose_file: str, mouth_file: str, mouth_coord) -> Image:
+        """Returns the character frame for a pose and mouth, rendering it only if it is not cached"""
+        key = ("character", pose_file, mouth_file, astuple(mouth_coord))
+        if key in self.frames:
+            return self.load(key)
+
+        frame = self.pose(pose_file).copy()
+        if mouth_file is not None:
+            mouth = self.mouth(mouth_file, mouth_coord)
+            mouth_width, mouth_height = mouth.size
+            paste_coordinates = (
+                int(mouth_coord.x - (mouth_width / 2)),
+                int(mouth_coord.y - (mouth_height / 2)),
+            )
+            frame.paste(im=mouth, box=paste_coordinates, mask=mouth)
+
+        self.store(key, frame)
+        return frame
+
+    def load(self, key: tuple) -> Image:
+        self.frames.move_to_end(key)
+        return self.frames[key]
+
+    def store(self, key: tuple, image: Image) -> None:
+        self.frames[key] = image
+        self.bytes += image_bytes(image)
+        # Evict the least recently used frames, always keeping the newest one
+        while self.bytes > self.max_bytes and len(self.frames) > 1:
+            _, evicted = self.frames.popitem(last=False)
+            self.bytes -= image_bytes(evicted)
+
+
+def image_bytes(image: Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+class animate_scene:
+    """Animates several characters, each lip synced to its own audio, into a single animation.
+    All characters are composited onto one canvas per frame in a single render loop.
+
+    Args:
+        tracks (list[Track]): The characters of the scene
+        fps (int): Frame rate of the animation
+        size (tuple): (optional) (width, height) of the canvas, defaults to the smallest canvas
+            that fits every character at its position
+        aligner_config (AlignerConfig): (optional) Settings used to force align every track
+        seed: Seed for every random choice of the scene, each track draws from its own seeded generator.
+            Pass None for a different scene every time.
+    """
+
+    def __init__(
+        self,
+        tracks: list[Track],
+        fps: int = 48,
+        size: tuple = None,
+        aligner_config: AlignerConfig = None,
+        seed=0,
+    ):
+        self.tracks = tracks
+        self.seed = seed
+        self.fps = fps
+        self.cache = AssetCache()
+        self.final_frames = []
+
+        for track in self.tracks:
+            if track.position[0] < 0 or track.position[1] < 0:
+                raise ValueError(f"Track positions must not be negative: {track.position}")
+
+        # Build the frame plan of every character without rendering any frames
+        self.animations = [
+            animate(
+                audio_file=track.audio_file,
+                transcript=track.transcript,
+                fps=self.fps,
+                aligner_config=aligner_config,
+                assets=track.assets,
+                render_frames=False,
+                seed=None if seed is None else f"{seed}:{i}",
+            )
+            for i, track in enumerate(self.tracks)
+        ]
+
+        self.num_frames = max(len(animation.sequence.pose_files) for animation in self.animations)
+        self.duration = self.num_frames / self.fps
+        self.size = size or self.get_canvas_size()
+        self.compile_scene()
+
+    def get_canvas_size(self) -> tuple:
+        width, height = 0, 0
+        for track, animation in self.track_animations():
+            width = max(width, int(track.position[0]) + animation.frame_size[0])
+            height = max(height, int(track.position[1]) + animation.frame_size[1])
+        return (width, height)
+
+    def fingerprint(self) -> str:
+        """Creates a stable hash of the scene from the fingerprint and position of every track and the canvas size
+
+        Returns:
+            str: Hex digest of the scene
+        """
+        data = {
+            "size": list(self.size),
+            "tracks": [
+                {"animation": animation.fingerprint(), "position": list(track.position)}
+                for track, animation in self.track_animations()
+            ],
+        }
+        return content_hash(data)
+
+    def track_animations(self):
+        return zip(self.tracks, self.animations)
+
+    def compile_scene(self):
+        for i in range(self.num_frames):
+            canvas = Image.new("RGBA", self.size, (0, 0, 0, 0))
+            for track, animation in self.track_animations():
+                # Characters whose audio already ended hold their last (silent) frame
+                idx = min(i, len(animation.sequence.pose_files) - 1)
+                character = self.cache.character(
+                    pose_file=animation.sequence.pose_files[idx],
+                    mouth_file=animation.sequence.mouth_files[idx],
+                    mouth_coord=animation.sequence.mouth_coords[idx],
+                )
+                canvas.alpha_composite(character, dest=tuple(int(p) for p in track.position))
+            self.final_frames.append(np.array(canvas))
+
+    def export(self, path: str, background: VideoClip, scale: float = 0.7, position=("center", "bottom")):
+        scene_clip = ImageSequenceClip(self.final_frames, fps=self.fps, with_mask=True)
+        new_height = int(background.size[1] * scale)
+        new_width = int(scene_clip.w * (new_height / scene_clip.h))
+        scene_clip = scene_clip.resize(width=new_width, height=new_height)
+
+        # Overlay the scene on top of the background clip
+        final_clip = CompositeVideoClip(clips=[background, scene_clip.set_position(position)], use_bgclip=True)
+
+        # Mix the speech of every character, with the same 0.2 second delay as a single animation.
+        # Tracks are resampled to a common rate first, the clips themselves only pick the nearest sample
+        sample_rate = max(animation.audio.sample_rate for animation in self.animations)
+        audio_clip = CompositeAudioClip(
+            [animation.audio.resample(sample_rate).to_clip().set_start(0.2) for animation in self.animations]
+        )
+        final_clip = final_clip.set_audio(audio_clip)
+
+        # Export video to .mp4
+        final_clip.write_videofile(
+            path,
+            codec="libx264",
+            audio_codec="aac",
+            audio_fps=sample_rate,
+            preset="ultrafast",
+            threads=4,
+            fps=self.fps,
+        )
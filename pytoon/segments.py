@@ -0,0 +1,178 @@
+import os
+import json
+import hashlib
+import zipfile
+from dataclasses import dataclass, asdict
+
+import numpy as np
+
+# Bump whenever frame rendering changes so stale cached segments are not reused
+CACHE_VERSION = 1
+PACKAGE_DIR = os.path.dirname(__file__)
+# Content digests of asset files, keyed by (path, mtime, size) so each file is only hashed once
+ASSET_DIGESTS = {}
+
+
+@dataclass
+class Segment:
+    """Data class for a run of frames that share a single character pose"""
+
+    start: int  # Index of the first frame in the segment
+    end: int  # Index one past the last frame in the segment
+    key: str = None  # Content hash of every input used to render the segment
+
+    @property
+    def length(self):
+        return self.end - self.start
+
+
+def split_segments(pose_changes: list) -> list[Segment]:
+    """Splits the animation timeline into segments at every pose change
+
+    Args:
+        pose_changes (list): Per-frame flags, 1 where the character changes pose (i.e. a breath)
+
+    Returns:
+        list[Segment]: Consecutive segments covering every frame of the animation
+    """
+    boundaries = [i for i, change in enumerate(pose_changes) if change and i != 0]
+    starts = [0] + boundaries
+    ends = boundaries + [len(pose_changes)]
+    return [Segment(start=start, end=end) for start, end in zip(starts, ends) if end > start]
+
+
+def segment_key(mouth_files: list, pose_files: list, mouth_coords: list, fps: int, seed) -> str:
+    """Creates a content hash of all inputs that determine the frames of a segment
+
+    Args:
+        mouth_files (list): Viseme image files for each frame in the segment
+        pose_files (list): Pose image files for each frame in the segment
+        mouth_coords (list[MouthCoordinates]): Mouth coordinates for each frame in the segment
+        fps (int): Frame rate of the animation
+        seed: Seed that drives the pose selection of the segment
+
+    Returns:
+        str: Hex digest that uniquely identifies the rendered segment
+    """
+    data = plan_data(mouth_files, pose_files, mouth_coords, fps)
+    data["seed"] = seed
+    return content_hash(data)
+
+
+def plan_fingerprint(mouth_files: list, pose_files: list, mouth_coords: list, fps: int, audio_digest: str) -> str:
+    """Creates a stable hash of a complete frame plan (including the contents of its images) and its audio.
+        Two animations with the same fingerprint render the same character frames and audio. The exported
+        video also depends on the export settings (background, scale, position), which are not included.
+
+    Args:
+        mouth_files (list): Viseme image files for every frame
+        pose_files (list): Pose image files for every frame
+        mouth_coords (list[MouthCoordinates]): Mouth coordinates for every frame
+        fps (int): Frame rate of the animation
+        audio_digest (str): Hash of the decoded audio (AudioBuffer.digest)
+
+    Returns:
+        str: Hex digest of the frame plan
+    """
+    data = plan_data(mouth_files, pose_files, mouth_coords, fps)
+    data["audio"] = audio_digest
+    return content_hash(data)
+
+
+def plan_data(mouth_files: list, pose_files: list, mouth_coords: list, fps: int) -> dict:
+    """Collects the per-frame inputs of a frame plan in a json serializable, install independent form.
+    The contents of every distinct image are included, so editing an asset in place invalidates the plan.
+    """
+    files = set(mouth_files) | set(pose_files)
+    files.discard(None)
+    return {
+        "version": CACHE_VERSION,
+        "mouth_files": [relative_asset(file) for file in mouth_files],
+        "pose_files": [relative_asset(file) for file in pose_files],
+        "mouth_coords": [asdict(coord) for coord in mouth_coords],
+        "assets": {relative_asset(file): file_digest(file) for file in files},
+        "fps": fps,
+    }
+
+
+def content_hash(data: dict) -> str:
+    payload = json.dumps(data, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def file_digest(file: str) -> str:
+    """Hashes the contents of a file, reusing the digest while its mtime and size are unchanged"""
+    stat = os.stat(file)
+    key = (os.path.abspath(file), stat.st_mtime_ns, stat.st_size)
+    if key not in ASSET_DIGESTS:
+        sha = hashlib.sha256()
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        ASSET_DIGESTS[key] = sha.hexdigest()
+    return ASSET_DIGESTS[key]
+
+
+def relative_asset(file: str) -> str:
+    """Strips the install location from built-in asset paths so hashes are portable, other paths stay absolute"""
+    if file is None:
+        return None
+    path = os.path.abspath(file)
+    package_dir = os.path.abspath(PACKAGE_DIR)
+    # Compare with commonpath rather than relpath, which fails for files on another drive on Windows
+    try:
+        inside = os.path.commonpath([path, package_dir]) == package_dir
+    except ValueError:
+        inside = False
+    if not inside:
+        return path.replace(os.sep, "/")
+    return os.path.relpath(path, package_dir).replace(os.sep, "/")
+
+
+class SegmentCache:
+    """Stores rendered animation segments on disk, addressed by their content hash."""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, key: str):
+        """Loads the frames of a cached segment
+
+        Args:
+            key (str): Content hash of the segment
+
+        Returns:
+            list[np.ndarray]: RGBA frames of the segment, or None if the segment is not cached
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            with np.load(path) as data:
+                frames = list(data["frames"])
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            # Corrupt or partially written segment, render it again
+            self.misses += 1
+            return None
+        self.hits += 1
+        return frames
+
+    def save(self, key: str, frames: list) -> None:
+        """Encodes the frames of a segment and writes them to the cache
+
+        Args:
+            key (str): Content hash of the segment
+            frames (list[np.ndarray]): RGBA frames of the segment
+        """
+        path = self.path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(temp_path, frames=np.stack(frames))
+        # Atomic rename so concurrent renders never read a half written segment
+        os.replace(temp_path, path)
@@ -0,0 +1,612 @@
+"""Local render service that keeps PyToon warm between jobs.
+
+Start a server and submit jobs to it from the command line:
+    python -m pytoon.server serve --workers 2 --memory-budget 16G --threads 2
+    python -m pytoon.server submit speech.mp3 --transcript speech.txt --background bg.png --output out.mp4 --wait
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import heapq
+import socket
+import asyncio
+import argparse
+import itertools
+import http.client
+import multiprocessing
+from http import HTTPStatus
+from dataclasses import dataclass, field, asdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+from .audio import audio_duration
+from .dataloader import get_assets
+from .lipsync import ENDING_SILENCE_SECONDS
+from .segments import content_hash, file_digest
+
+DEFAULT_PORT = 8765
+# Every rendered frame is held in memory as an RGBA array until export
+BYTES_PER_PIXEL = 4
+# Decoded audio, alignment emissions and MoviePy buffers of a single job
+JOB_OVERHEAD = 256 * 1024**2
+# Share of the machine's physical memory that running jobs may use by default.
+# Every second of audio costs fps x 960 x 1080 x 4 bytes (~199MB at 48 fps).
+MEMORY_BUDGET_FRACTION = 0.75
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+# Fields a client may send for a job and their types
+JOB_FIELDS = {
+    "audio_file": str,
+    "output": str,
+    "transcript": str,
+    "background": str,
+    "fps": int,
+    "scale": float,
+    "priority": int,
+    "seed": int,
+}
+
+
+@dataclass
+class RenderJob:
+    """Data class for a queued animate + export job"""
+
+    audio_file: str  # Path to the audio file (on the server's file system)
+    output: str  # Path of the exported .mp4 file
+    transcript: str = None  # Transcript text, generated with speech to text if None
+    background: str = None  # Path to a background image or video, plain white if None
+    fps: int = 48  # Frame rate of the animation
+    scale: float = 0.7  # Height of the animation relative to the background
+    priority: int = 0  # Jobs with higher priority are admitted first
+    seed: int = 0  # Seed of the animation, identical jobs with the same seed render identical videos
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = "queued"  # queued, running, done, failed or cancelled
+    memory: int = 0  # Estimated peak memory of the job (bytes)
+    fingerprint: str = None  # Fingerprint of the exported video (frame plan, audio and export settings), set when done
+    error: str = None
+    submitted: float = field(default_factory=time.time)
+    started: float = None
+    finished: float = None
+
+
+# Aligner settings and character assets of the current worker process, set by warm_worker
+WORKER_ALIGNER_CONFIG = None
+WORKER_ASSETS = None
+
+
+def warm_worker(aligner_options: dict) -> None:
+    """Initializes a worker process by loading MoviePy, the assets and the acoustic model once"""
+    global WORKER_ALIGNER_CONFIG, WORKER_ASSETS
+    import torch
+    import torchaudio
+    from . import animator
+    from .lipsync import AlignerConfig
+    from .aligner import get_acoustic_model
+
+    config = AlignerConfig(**aligner_options)
+    if config.num_threads:
+        torch.set_num_threads(config.num_threads)
+    if config.num_interop_threads:
+        torch.set_num_interop_threads(config.num_interop_threads)
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    get_acoustic_model(torchaudio.pipelines.WAV2VEC2_ASR_BASE_960H, device, quantize=config.quantize)
+    WORKER_ALIGNER_CONFIG = config
+    WORKER_ASSETS = get_assets()
+
+
+def worker_ready() -> int:
+    return os.getpid()
+
+
+def render_job(job: dict) -> str:
+    """Renders and exports a single job inside a warm worker process
+
+    Args:
+        job (dict): RenderJob fields
+
+    Returns:
+        str: Fingerprint of the exported video (see job_fingerprint)
+    """
+    from moviepy.editor import ColorClip, ImageClip, VideoFileClip
+    from .animator import animate
+
+    animation = animate(
+        audio_file=job["audio_file"],
+        transcript=job["transcript"],
+        fps=job["fps"],
+        seed=job["seed"],
+        aligner_config=WORKER_ALIGNER_CONFIG,
+        assets=WORKER_ASSETS,
+    )
+
+    background = job["background"]
+    if background is None:
+        background_clip = ColorClip(size=(1920, 1080), color=(255, 255, 255))
+        background_clip = background_clip.set_fps(job["fps"]).set_duration(animation.duration)
+    elif background.lower().endswith(IMAGE_EXTENSIONS):
+        background_clip = ImageClip(background).set_fps(job["fps"]).set_duration(animation.duration)
+    else:
+        background_clip = VideoFileClip(background)
+
+    animation.export(path=job["output"], background=background_clip, scale=job["scale"])
+    return job_fingerprint(job, animation.fingerprint())
+
+
+def job_fingerprint(job: dict, animation_fingerprint: str) -> str:
+    """Creates a stable hash of everything that determines the exported video of a job
+
+    Args:
+        job (dict): RenderJob fields
+        animation_fingerprint (str): Fingerprint of the animation's frame plan and audio (animate.fingerprint)
+
+    Returns:
+        str: Hex digest of the job, jobs with the same fingerprint export the same video
+    """
+    background = job["background"]
+    data = {
+        "animation": animation_fingerprint,
+        "background": file_digest(background) if background else None,
+        "scale": job["scale"],
+        "fps": job["fps"],
+    }
+    return content_hash(data)
+
+
+def parse_job(spec: dict) -> dict:
+    """Validates the fields of a job sent by a client and converts them to their types
+
+    Args:
+        spec (dict): Decoded JSON body of the request
+
+    Returns:
+        dict: RenderJob fields
+    """
+    if not isinstance(spec, dict):
+        raise ValueError("Jobs must be a JSON object")
+    unknown = set(spec) - set(JOB_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown job fields: {', '.join(sorted(map(str, unknown)))}")
+    if spec.get("audio_file") is None or spec.get("output") is None:
+        raise ValueError("Jobs require 'audio_file' and 'output'")
+
+    fields = {}
+    for name, value in spec.items():
+        field_type = JOB_FIELDS[name]
+        if value is None and name in ("transcript", "background"):
+            fields[name] = None
+        elif field_type is str:
+            if not isinstance(value, str):
+                raise ValueError(f"Job field '{name}' must be a string")
+            fields[name] = value
+        else:
+            try:
+                fields[name] = field_type(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Job field '{name}' must be {'an integer' if field_type is int else 'a number'}")
+    if fields.get("fps", 1) <= 0 or fields.get("scale", 1) <= 0:
+        raise ValueError("Job fields 'fps' and 'scale' must be positive")
+    return fields
+
+
+def get_frame_size() -> tuple:
+    """Reads the (width, height) of the character pose images without decoding them"""
+    pose = get_assets().explain[0]
+    with Image.open(pose.image_files["open"]) as image:
+        return image.size
+
+
+def default_memory_budget() -> int:
+    """Returns the default memory budget, a fraction of the machine's physical memory (bytes)"""
+    try:
+        physical_memory = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        # os.sysconf is not available on Windows
+        raise ValueError("Could not read the physical memory of this machine, pass a memory budget")
+    return int(physical_memory * MEMORY_BUDGET_FRACTION)
+
+
+def parse_size(size: str) -> int:
+    """Parses a memory size such as '512M' or '8G' to bytes"""
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+    size = str(size).strip().upper().rstrip("B")
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+class RenderServer:
+    """Queues render jobs by priority and runs them in a pool of warm worker processes.
+    A job is only admitted while the estimated memory of all running jobs fits in the budget.
+
+    Args:
+        workers (int): Number of worker processes
+        memory_budget (int): Total estimated memory (bytes) that running jobs may use, defaults to 3/4 of
+            the physical memory. Each second of audio needs ~199MB at 48 fps (see estimate_memory).
+        aligner_options (dict): AlignerConfig fields used by every worker (e.g. num_threads, quantize)
+    """
+
+    def __init__(self, workers: int = 1, memory_budget: int = None, aligner_options: dict = None):
+        self.workers = workers
+        self.memory_budget = memory_budget or default_memory_budget()
+        self.aligner_options = aligner_options or {}
+        self.frame_size = get_frame_size()
+        self.jobs = {}
+        self.queue = []
+        self.counter = itertools.count()
+        self.memory_in_use = 0
+        self.running = 0
+        self.pool = None
+        self.wakeup = None
+
+    def estimate_memory(self, duration: float, fps: int) -> int:
+        """Estimates the peak memory of a job from audio duration x fps x frame size
+
+        Args:
+            duration (float): Duration of the audio (seconds)
+            fps (int): Frame rate of the animation
+
+        Returns:
+            int: Estimated peak memory (bytes)
+        """
+        width, height = self.frame_size
+        num_frames = int((duration + ENDING_SILENCE_SECONDS) * fps) + 1
+        return num_frames * width * height * BYTES_PER_PIXEL + JOB_OVERHEAD
+
+    async def submit(self, spec: dict) -> RenderJob:
+        """Validates a job, estimates its memory and adds it to the queue
+
+        Args:
+            spec (dict): RenderJob fields sent by the client
+
+        Returns:
+            RenderJob: The queued job
+        """
+        job = RenderJob(**parse_job(spec))
+        if not os.path.exists(job.audio_file):
+            raise FileNotFoundError(f"Audio file not found: {job.audio_file}")
+
+        # Probing the audio runs ffmpeg, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        duration = await loop.run_in_executor(None, audio_duration, job.audio_file)
+        job.memory = self.estimate_memory(duration, job.fps)
+        if job.memory > self.memory_budget:
+            raise MemoryError(
+                f"Job needs ~{job.memory / 1024**2:.0f}MB, more than the "
+                f"{self.memory_budget / 1024**2:.0f}MB memory budget"
+            )
+
+        self.jobs[job.id] = job
+        heapq.heappush(self.queue, (-job.priority, next(self.counter), job.id))
+        self.wakeup.set()
+        return job
+
+    def cancel(self, job_id: str) -> RenderJob:
+        job = self.jobs[job_id]
+        if job.status != "queued":
+            raise ValueError(f"Job {job_id} is {job.status} and can not be cancelled")
+        job.status = "cancelled"
+        job.finished = time.time()
+        return job
+
+    def status(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": sum(job.status == "queued" for job in self.jobs.values()),
+            "memory_budget": self.memory_budget,
+            "memory_in_use": self.memory_in_use,
+        }
+
+    async def schedule(self):
+        """Admits queued jobs in priority order whenever a worker and enough memory are free"""
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.queue and self.running < self.workers:
+                job = self.jobs[self.queue[0][2]]
+                if job.status == "cancelled":
+                    heapq.heappop(self.queue)
+                    continue
+                # Wait for memory to free up rather than letting smaller jobs starve the head of the queue
+                if self.memory_in_use + job.memory > self.memory_budget:
+                    break
+                heapq.heappop(self.queue)
+                self.memory_in_use += job.memory
+                self.running += 1
+                asyncio.create_task(self.run(job))
+
+    async def run(self, job: RenderJob):
+        loop = asyncio.get_running_loop()
+        pool = self.pool
+        job.status = "running"
+        job.started = time.time()
+        try:
+            job.fingerprint = await loop.run_in_executor(pool, render_job, asdict(job))
+            job.status = "done"
+        except BrokenProcessPool as e:
+            # A worker died (e.g. killed for running out of memory), replace the pool once
+            job.status = "failed"
+            job.error = f"Worker crashed: {e}"
+            if pool is self.pool:
+                pool.shutdown(wait=False)
+                self.pool = self.create_pool()
+        except Exception as e:
+            job.status = "failed"
+            job.error = repr(e)
+        finally:
+            job.finished = time.time()
+            self.memory_in_use -= job.memory
+            self.running -= 1
+            self.wakeup.set()
+
+    def create_pool(self) -> ProcessPoolExecutor:
+        # Spawn, so workers do not inherit the server's state (and torch is never forked)
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=warm_worker,
+            initargs=(self.aligner_options,),
+        )
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Handles a single HTTP request of the job API"""
+        try:
+            request = await read_request(reader)
+            if request is not None:
+                status, payload = await self.route(*request)
+                write_response(writer, status, payload)
+                await writer.drain()
+        except Exception as e:
+            # Malformed request line, headers or body
+            write_response(writer, HTTPStatus.BAD_REQUEST, {"error": str(e)})
+        finally:
+            writer.close()
+
+    async def route(self, method: str, target: str, body: bytes) -> tuple:
+        parts = [part for part in target.split("?")[0].split("/") if part]
+        try:
+            if method == "GET" and parts == ["status"]:
+                return HTTPStatus.OK, self.status()
+            if method == "GET" and parts == ["jobs"]:
+                return HTTPStatus.OK, {"jobs": [asdict(job) for job in self.jobs.values()]}
+            if method == "POST" and parts == ["jobs"]:
+                job = await self.submit(json.loads(body or b"{}"))
+                return HTTPStatus.CREATED, asdict(job)
+            if len(parts) == 2 and parts[0] == "jobs":
+                if method == "GET":
+                    return HTTPStatus.OK, asdict(self.jobs[parts[1]])
+                if method == "DELETE":
+                    return HTTPStatus.OK, asdict(self.cancel(parts[1]))
+        except KeyError:
+            return HTTPStatus.NOT_FOUND, {"error": f"Job not found: {parts[-1]}"}
+        except MemoryError as e:
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": str(e)}
+        except Exception as e:
+            # Invalid job, unreadable audio (OSError from ffmpeg), etc.
+            return HTTPStatus.BAD_REQUEST, {"error": f"{type(e).__name__}: {e}"}
+        return HTTPStatus.NOT_FOUND, {"error": f"No route for {method} {target}"}
+
+    async def serve(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, socket_path: str = None):
+        """Starts the worker pool and serves the job API until cancelled
+
+        Args:
+            host (str, optional): Interface for the HTTP API. Defaults to localhost only.
+            port (int, optional): Port for the HTTP API.
+            socket_path (str, optional): Serve on this Unix socket instead of TCP.
+        """
+        self.wakeup = asyncio.Event()
+        self.pool = self.create_pool()
+        loop = asyncio.get_running_loop()
+        # Start and warm every worker before accepting jobs
+        await asyncio.gather(*[loop.run_in_executor(self.pool, worker_ready) for _ in range(self.workers)])
+
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle, path=socket_path)
+            print(f"PyToon render server listening on {socket_path}")
+        else:
+            server = await asyncio.start_server(self.handle, host=host, port=port)
+            print(f"PyToon render server listening on http://{host}:{port}")
+
+        scheduler = asyncio.create_task(self.schedule())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            scheduler.cancel()
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def read_request(reader: asyncio.StreamReader):
+    """Reads an HTTP/1.1 request and returns its (method, target, body)"""
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    if not request_line:
+        return None
+    method, target, _ = request_line.split(" ", 2)
+
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length", 0))
+    body = await reader.readexactly(length) if length else b""
+    return method, target, body
+
+
+def write_response(writer: asyncio.StreamWriter, status: HTTPStatus, payload: dict) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection that talks to the render server over a Unix socket"""
+
+    def __init__(self, socket_path: str):
+        super().__init__("localhost")
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+class RenderClient:
+    """Client for the render server's job API.
+
+    Args:
+        host (str, optional): Host of the render server.
+        port (int, optional): Port of the render server.
+        socket_path (str, optional): Connect over this Unix socket instead of TCP.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, socket_path: str = None):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+
+    def request(self, method: str, path: str, payload: dict = None) -> dict:
+        if self.socket_path:
+            connection = UnixHTTPConnection(self.socket_path)
+        else:
+            connection = http.client.HTTPConnection(self.host, self.port)
+        try:
+            body = json.dumps(payload) if payload is not None else None
+            connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            data = json.loads(response.read() or b"{}")
+        finally:
+            connection.close()
+        if response.status >= 400:
+            raise RuntimeError(f"{response.status} {response.reason}: {data.get('error')}")
+        return data
+
+    def submit(self, **job) -> dict:
+        return self.request("POST", "/jobs", job)
+
+    def job(self, job_id: str) -> dict:
+        return self.request("GET", f"/jobs/{job_id}")
+
+    def jobs(self) -> list:
+        return self.request("GET", "/jobs")["jobs"]
+
+    def cancel(self, job_id: str) -> dict:
+        return self.request("DELETE", f"/jobs/{job_id}")
+
+    def status(self) -> dict:
+        return self.request("GET", "/status")
+
+    def wait(self, job_id: str, poll_interval: float = 1.0) -> dict:
+        """Blocks until a job is done, failed or cancelled"""
+        while True:
+            job = self.job(job_id)
+            if job["status"] not in ("queued", "running"):
+                return job
+            time.sleep(poll_interval)
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(prog="python -m pytoon.server", description="PyToon render server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", dest="socket_path", help="Unix socket path (instead of TCP)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Start the render server")
+    serve.add_argument("--workers", type=int, default=1, help="Number of warm worker processes")
+    serve.add_argument(
+        "--memory-budget",
+        help="Memory budget for running jobs, e.g. 8G (~199MB per second of audio at 48 fps). "
+        "Defaults to 3/4 of the physical memory",
+    )
+    serve.add_argument("--threads", type=int, help="Torch intra-op threads per worker")
+    serve.add_argument("--interop-threads", type=int, help="Torch inter-op threads per worker")
+    serve.add_argument("--quantize", action="store_true", help="Use an int8 acoustic model for alignment")
+
+    submit = commands.add_parser("submit", help="Submit a render job")
+    submit.add_argument("audio_file")
+    submit.add_argument("--output", required=True)
+    submit.add_argument("--transcript", help="Path to a transcript text file")
+    submit.add_argument("--background", help="Path to a background image or video")
+    submit.add_argument("--fps", type=int, default=48)
+    submit.add_argument("--scale", type=float, default=0.7)
+    submit.add_argument("--priority", type=int, default=0)
+    submit.add_argument("--seed", type=int, default=0)
+    submit.add_argument("--wait", action="store_true", help="Wait for the job to finish")
+
+    job = commands.add_parser("job", help="Show a job")
+    job.add_argument("job_id")
+    cancel = commands.add_parser("cancel", help="Cancel a queued job")
+    cancel.add_argument("job_id")
+    commands.add_parser("jobs", help="List all jobs")
+    commands.add_parser("status", help="Show server status")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        aligner_options = {"quantize": args.quantize}
+        if args.threads:
+            aligner_options["num_threads"] = args.threads
+        if args.interop_threads:
+            aligner_options["num_interop_threads"] = args.interop_threads
+        server = RenderServer(
+            workers=args.workers,
+            memory_budget=parse_size(args.memory_budget) if args.memory_budget else None,
+            aligner_options=aligner_options,
+        )
+        try:
+            asyncio.run(server.serve(host=args.host, port=args.port, socket_path=args.socket_path))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    client = RenderClient(host=args.host, port=args.port, socket_path=args.socket_path)
+    try:
+        if args.command == "submit":
+            transcript = None
+            if args.transcript:
+                with open(args.transcript, "r") as file:
+                    transcript = file.read()
+            # Paths are resolved here since the server may run in a different working directory
+            result = client.submit(
+                audio_file=os.path.abspath(args.audio_file),
+                output=os.path.abspath(args.output),
+                transcript=transcript,
+                background=os.path.abspath(args.background) if args.background else None,
+                fps=args.fps,
+                scale=args.scale,
+                priority=args.priority,
+                seed=args.seed,
+            )
+            if args.wait:
+                result = client.wait(result["id"])
+        elif args.command == "job":
+            result = client.job(args.job_id)
+        elif args.command == "cancel":
+            result = client.cancel(args.job_id)
+        elif args.command == "jobs":
+            result = client.jobs()
+        else:
+            result = client.status()
+    except (RuntimeError, OSError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(result, indent=4))
+    if isinstance(result, dict) and result.get("status") == "failed":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
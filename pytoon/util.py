@@ -1,9 +1,10 @@
 import json
 import os
 from scipy.io import wavfile
-from scipy.signal import resample
 import numpy as np
 
+from .audio import read_wav, resample_chunked
+
 
 def read_json(file: str) -> dict:
     """Reads a json file to dictionary
@@ -49,18 +50,15 @@ def resample_audio(
     Returns:
         tuple: Returns numpy array of resampled audio and the new audio sample rate
     """
-    original_sample_rate, audio_data = wavfile.read(audio_file)
-    resample_ratio = target_sr / original_sample_rate
-    total_samples = int(len(audio_data) * resample_ratio)
-
-    # Resamples the audio to have only 'total_samples' number of samples
-    resampled_audio = resample(x=audio_data, num=total_samples)
-    resampled_audio = resampled_audio.astype(np.int16)
+    # Memory-map the input and resample it in chunks so long recordings are never fully copied
+    original_sample_rate, audio_data = read_wav(audio_file, mmap=True)
+    resampled_audio = resample_chunked(samples=audio_data, orig_sr=original_sample_rate, target_sr=target_sr)
+    resampled_audio = np.clip(resampled_audio, -32768, 32767).astype(np.int16)
 
     # Adds silence to end of audio so num samples is divisible by sample rate
     zero_pad = target_sr - (len(resampled_audio) % target_sr)
     if padding and int(zero_pad) not in [0, target_sr]:
-        silence = np.zeros(zero_pad, dtype=np.int16)
+        silence = np.zeros((zero_pad,) + resampled_audio.shape[1:], dtype=np.int16)
         resampled_audio = np.concatenate((resampled_audio, silence))
 
     if output_file:
@@ -11,7 +11,7 @@ setup(
     version="1.5.0",
     packages=find_packages(),
     install_requires=[
-        "forcealign>=1.1.9",
+        "forcealign>=1.1.9,<1.2",
         "moviepy",
         "opencv-python",
         "scipy",
@@ -0,0 +1,82 @@
+import os
+import gc
+import subprocess
+from math import gcd
+
+import numpy as np
+import pytest
+import imageio_ffmpeg
+from scipy.signal import resample_poly
+
+from pytoon.audio import AudioBuffer, load_audio, audio_duration, resample_chunked, to_float
+
+SPEECH_MP3 = os.path.join(os.path.dirname(__file__), "..", ".test", "speech.mp3")
+
+
+def test_mmap_audio_removes_decoded_wav_on_close(tmp_path):
+    audio = load_audio(SPEECH_MP3, mmap=True, cache_dir=str(tmp_path))
+    assert len(os.listdir(tmp_path)) == 1
+
+    audio.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_mmap_audio_removes_temp_dir_when_collected(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    audio = load_audio(SPEECH_MP3, mmap=True)
+    assert len(os.listdir(tmp_path)) == 1
+
+    del audio
+    gc.collect()
+    assert os.listdir(tmp_path) == []
+
+
+def test_non_pcm_wav_is_decoded_with_ffmpeg(tmp_path):
+    alaw_file = str(tmp_path / "speech_alaw.wav")
+    command = [imageio_ffmpeg.get_ffmpeg_exe(), "-loglevel", "error", "-t", "2", "-i", SPEECH_MP3]
+    subprocess.run(command + ["-acodec", "pcm_alaw", "-ar", "8000", alaw_file], check=True)
+
+    audio = load_audio(alaw_file)
+    assert audio.sample_rate == 8000
+    assert audio.samples.dtype == np.int16
+    assert abs(audio.duration - 2) < 0.05
+    assert abs(audio_duration(alaw_file) - 2) < 0.05
+
+
+@pytest.mark.parametrize("orig_sr, target_sr", [(44100, 16000), (48000, 16000), (16000, 44100), (22050, 48000)])
+@pytest.mark.parametrize("chunk_size", [1000, 4096, 1 << 18])
+@pytest.mark.parametrize("channels", [1, 2])
+def test_resample_chunked_matches_resample_poly(orig_sr, target_sr, chunk_size, channels):
+    rng = np.random.default_rng(0)
+    shape = (orig_sr // 2 + 7,) if channels == 1 else (orig_sr // 2 + 7, channels)
+    samples = rng.standard_normal(shape).astype(np.float32)
+
+    divisor = gcd(orig_sr, target_sr)
+    expected = resample_poly(samples, target_sr // divisor, orig_sr // divisor, axis=0)
+    resampled = resample_chunked(samples, orig_sr=orig_sr, target_sr=target_sr, chunk_size=chunk_size)
+
+    assert resampled.shape == expected.shape
+    np.testing.assert_allclose(resampled, expected, atol=1e-5)
+
+
+def test_to_clip_returns_samples_and_silence_outside_the_recording():
+    samples = np.array([[0, 16384], [8192, -16384], [-32768, 4096], [16384, 0]], dtype=np.int16)
+    clip = AudioBuffer(path="speech.wav", samples=samples, sample_rate=4).to_clip()
+
+    assert clip.duration == 1
+    np.testing.assert_allclose(clip.get_frame(0.5), [-1.0, 0.125])
+    np.testing.assert_allclose(clip.get_frame(np.array([0.0, 0.75])), [[0.0, 0.5], [0.5, 0.0]])
+    np.testing.assert_allclose(clip.make_frame(np.array([-1.0, 2.0])), np.zeros((2, 2)))
+
+
+def test_resample_buffer_to_a_common_rate():
+    t = np.arange(16000) / 16000
+    samples = (np.sin(2 * np.pi * 440 * t) * 16384).astype(np.int16)
+    audio = AudioBuffer(path="speech.wav", samples=samples, sample_rate=16000)
+
+    resampled = audio.resample(44100)
+    assert resampled.sample_rate == 44100
+    assert resampled.samples.shape == (44100, 1)
+    expected = resample_poly(to_float(samples), 441, 160)
+    np.testing.assert_allclose(resampled.samples[:, 0], expected, atol=1e-5)
+    assert audio.resample(16000) is audio
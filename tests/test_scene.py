@@ -0,0 +1,76 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pytest
+
+from pytoon import animator
+from pytoon.audio import AudioBuffer
+from pytoon.dataloader import get_assets
+from pytoon.lipsync import sequence_words
+from pytoon.scene import AssetCache, Track, animate_scene
+
+FPS = 12
+
+
+@dataclass
+class Word:
+    """Stand-in for forcealign.Word"""
+
+    word: str
+    phonemes: list
+    time_start: float
+    time_end: float
+    breath: bool = False
+
+
+# Force aligned words of each (stubbed) audio file
+WORDS = {
+    "host.wav": [
+        Word("HELLO", ["HH", "AH0", "L", "OW1"], 0.1, 0.5, breath=True),
+        Word("THERE", ["DH", "EH1", "R"], 0.6, 0.9),
+    ],
+    "guest.wav": [
+        Word("HI", ["HH", "AY1"], 0.2, 0.4, breath=True),
+        Word("THANKS", ["TH", "AE1", "NG", "K", "S"], 0.9, 1.4, breath=True),
+    ],
+}
+
+
+@pytest.fixture
+def stub_alignment(monkeypatch):
+    def load_audio(audio_file, mmap=False):
+        return AudioBuffer(path=audio_file, samples=np.zeros(16000 * 2, dtype=np.int16), sample_rate=16000)
+
+    def viseme_sequencer(audio, transcript, fps, aligner_config, seed=None):
+        return sequence_words(WORDS[audio.path], fps=fps, seed=seed)
+
+    monkeypatch.setattr(animator, "load_audio", load_audio)
+    monkeypatch.setattr(animator, "viseme_sequencer", viseme_sequencer)
+
+
+def test_scene_tracks_match_single_animations(stub_alignment):
+    tracks = [Track(audio_file="host.wav", position=(0, 0)), Track(audio_file="guest.wav", position=(1000, 20))]
+    scene = animate_scene(tracks, fps=FPS, seed=7)
+
+    for i, track in enumerate(tracks):
+        animation = animator.animate(track.audio_file, fps=FPS, seed=f"7:{i}")
+        x, y = track.position
+        width, height = animation.frame_size
+        for frame, expected in zip(scene.final_frames, animation.final_frames):
+            region = frame[y : y + height, x : x + width]
+            opaque = expected[:, :, 3] == 255
+            assert opaque.any()
+            np.testing.assert_array_equal(region[opaque], expected[opaque])
+
+
+def test_asset_cache_stays_within_max_bytes():
+    pose = get_assets().explain[0]
+    max_bytes = 3 * 960 * 1080 * 4
+    cache = AssetCache(max_bytes=max_bytes)
+    for eyes in ("open", "middle", "shut"):
+        for mouth in ("1.png", "2.png", "9.png"):
+            mouth_file = f"{os.path.dirname(animator.__file__)}/assets/visemes/positive/{mouth}"
+            cache.character(pose.image_files[eyes], mouth_file, pose.mouth_coordinates)
+            assert cache.bytes <= max_bytes
+    assert len(cache.frames) == 3
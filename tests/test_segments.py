@@ -0,0 +1,115 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from pytoon import animator
+from pytoon.audio import AudioBuffer
+from pytoon.lipsync import sequence_words
+from pytoon.segments import PACKAGE_DIR, SegmentCache, relative_asset, segment_key
+
+
+@dataclass
+class Word:
+    """Stand-in for forcealign.Word"""
+
+    word: str
+    phonemes: list
+    time_start: float
+    time_end: float
+    breath: bool = False
+
+
+# (word, phonemes, duration), a None word is a pause
+SENTENCES = [
+    [("HELLO", ["HH", "AH0", "L", "OW1"], 0.41), (None, None, 0.13), ("THERE", ["DH", "EH1", "R"], 0.33)],
+    [("THIS", ["DH", "IH1", "S"], 0.27), ("IS", ["IH1", "Z"], 0.17), ("PYTOON", ["P", "AY1", "T", "UW1", "N"], 0.58)],
+    [("IT", ["IH1", "T"], 0.19), (None, None, 0.21), ("TALKS", ["T", "AO1", "K", "S"], 0.46)],
+    [("GOODBYE", ["G", "UH0", "D", "B", "AY1"], 0.63), ("NOW", ["N", "AW1"], 0.37)],
+]
+
+
+def make_words(sentences: list) -> list[Word]:
+    words = []
+    t = 0.05
+    for sentence in sentences:
+        breath = True
+        for text, phonemes, duration in sentence:
+            if text is not None:
+                words.append(Word(text, phonemes, round(t, 3), round(t + duration, 3), breath=breath))
+                breath = False
+            t += duration
+        t += 0.35
+    return words
+
+
+def segment_keys(monkeypatch, tmp_path, words: list, seed=0) -> list[str]:
+    audio = AudioBuffer(path="speech.wav", samples=np.zeros(16000 * 8, dtype=np.int16), sample_rate=16000)
+    monkeypatch.setattr(animator, "load_audio", lambda audio_file, mmap=False: audio)
+    monkeypatch.setattr(
+        animator,
+        "viseme_sequencer",
+        lambda audio, transcript, fps, aligner_config, seed=None: sequence_words(words, fps=fps, seed=seed),
+    )
+    animation = animator.animate("speech.wav", cache_dir=str(tmp_path), seed=seed, render_frames=False)
+    return [segment.key for segment in animation.segments]
+
+
+def test_edit_only_changes_its_own_segment(monkeypatch, tmp_path):
+    original = segment_keys(monkeypatch, tmp_path, make_words(SENTENCES))
+
+    # Re-split the first word into two words over the same time span
+    edited_sentences = [
+        [("HEL", ["HH", "AH0"], 0.2), ("LO", ["L", "OW1"], 0.21)] + SENTENCES[0][1:]
+    ] + SENTENCES[1:]
+    edited = segment_keys(monkeypatch, tmp_path, make_words(edited_sentences))
+
+    assert len(original) == len(edited) == len(SENTENCES)
+    assert original[0] != edited[0]
+    assert original[1:] == edited[1:]
+
+
+def test_same_seed_same_keys(monkeypatch, tmp_path):
+    words = make_words(SENTENCES)
+    assert segment_keys(monkeypatch, tmp_path, words, seed=3) == segment_keys(monkeypatch, tmp_path, words, seed=3)
+    assert segment_keys(monkeypatch, tmp_path, words, seed=3) != segment_keys(monkeypatch, tmp_path, words, seed=4)
+
+
+def test_editing_an_asset_changes_the_key(tmp_path):
+    pose_file = tmp_path / "pose.png"
+    pose_file.write_bytes(b"pose")
+    mouth_files, pose_files, mouth_coords = [None, None], [str(pose_file)] * 2, []
+
+    key = segment_key(mouth_files, pose_files, mouth_coords, fps=48, seed=0)
+    assert segment_key(mouth_files, pose_files, mouth_coords, fps=48, seed=0) == key
+
+    pose_file.write_bytes(b"edited pose")
+    assert segment_key(mouth_files, pose_files, mouth_coords, fps=48, seed=0) != key
+
+
+def test_truncated_segment_is_a_miss(tmp_path):
+    cache = SegmentCache(str(tmp_path))
+    frames = [np.full((4, 4, 4), i, dtype=np.uint8) for i in range(3)]
+    cache.save("segment", frames)
+    with open(cache.path("segment"), "rb") as f:
+        data = f.read()
+    assert all((a == b).all() for a, b in zip(cache.load("segment"), frames))
+
+    for size in (0, 10, len(data) // 2, len(data) - 5):
+        with open(cache.path("segment"), "wb") as f:
+            f.write(data[:size])
+        assert cache.load("segment") is None
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_unseeded_poses_are_random(monkeypatch, tmp_path):
+    words = make_words(SENTENCES)
+    keys = [tuple(segment_keys(monkeypatch, tmp_path, words, seed=None)) for _ in range(5)]
+    assert len(set(keys)) > 1
+
+
+def test_relative_asset(tmp_path):
+    assert relative_asset(os.path.join(PACKAGE_DIR, "assets", "poses", "1.png")) == "assets/poses/1.png"
+    custom = tmp_path / "poses" / "1.png"
+    assert relative_asset(str(custom)) == str(custom).replace(os.sep, "/")
+    assert relative_asset(None) is None
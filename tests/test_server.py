@@ -0,0 +1,133 @@
+import os
+import json
+import asyncio
+from http import HTTPStatus
+from concurrent.futures import Executor, Future
+
+import pytest
+
+from pytoon.server import MEMORY_BUDGET_FRACTION, RenderServer, job_fingerprint
+
+SPEECH_WAV = os.path.join(os.path.dirname(__file__), "..", ".test", "speech.wav")
+
+
+def post_job(server: RenderServer, body) -> tuple:
+    async def post():
+        server.wakeup = asyncio.Event()
+        return await server.route("POST", "/jobs", json.dumps(body).encode("utf-8"))
+
+    return asyncio.run(post())
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        [SPEECH_WAV, "out.mp4"],
+        {"audio_file": SPEECH_WAV, "output": "out.mp4", "fps": "fast"},
+        {"audio_file": SPEECH_WAV, "output": "out.mp4", "scale": [0.7]},
+        {"audio_file": SPEECH_WAV, "output": 1},
+        {"audio_file": SPEECH_WAV, "output": "out.mp4", "color": "red"},
+        {"output": "out.mp4"},
+    ],
+)
+def test_invalid_jobs_are_bad_requests(body):
+    status, payload = post_job(RenderServer(), body)
+    assert status == HTTPStatus.BAD_REQUEST
+    assert payload["error"]
+
+
+def test_unreadable_audio_is_a_bad_request(tmp_path):
+    audio_file = tmp_path / "speech.mp3"
+    audio_file.write_bytes(b"not audio")
+    status, _ = post_job(RenderServer(), {"audio_file": str(audio_file), "output": "out.mp4"})
+    assert status == HTTPStatus.BAD_REQUEST
+
+
+def test_job_fields_are_converted():
+    server = RenderServer(memory_budget=16 * 1024**3)
+    status, job = post_job(server, {"audio_file": SPEECH_WAV, "output": "out.mp4", "fps": "24", "priority": "2"})
+    assert status == HTTPStatus.CREATED
+    assert (job["fps"], job["priority"]) == (24, 2)
+    assert server.queue[0][0] == -2
+
+
+def test_job_fingerprint_covers_export_settings(tmp_path):
+    background = tmp_path / "background.png"
+    background.write_bytes(b"background")
+    job = {"background": str(background), "scale": 0.7, "fps": 48}
+    fingerprint = job_fingerprint(job, "animation")
+
+    assert job_fingerprint(dict(job), "animation") == fingerprint
+    assert job_fingerprint(dict(job, scale=0.5), "animation") != fingerprint
+    assert job_fingerprint(dict(job, background=None), "animation") != fingerprint
+    background.write_bytes(b"edited background")
+    assert job_fingerprint(job, "animation") != fingerprint
+
+
+def test_default_memory_budget_follows_physical_memory():
+    physical_memory = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    assert RenderServer().memory_budget == int(physical_memory * MEMORY_BUDGET_FRACTION)
+
+
+class StubPool(Executor):
+    """In-process stand-in for the worker pool, jobs finish when the test resolves their futures"""
+
+    def __init__(self):
+        self.started = {}
+
+    def submit(self, fn, job):
+        self.started[job["id"]] = Future()
+        return self.started[job["id"]]
+
+
+def test_jobs_are_admitted_by_priority_within_the_memory_budget(monkeypatch):
+    async def settle():
+        for _ in range(20):
+            await asyncio.sleep(0)
+
+    async def scenario():
+        server = RenderServer(workers=3, memory_budget=100)
+        server.wakeup = asyncio.Event()
+        server.pool = pool = StubPool()
+        # The fps of each job is used as its memory estimate
+        monkeypatch.setattr(server, "estimate_memory", lambda duration, fps: fps)
+
+        async def submit(priority, memory):
+            spec = {"audio_file": SPEECH_WAV, "output": "out.mp4", "fps": memory, "priority": priority}
+            job = await server.submit(spec)
+            return job.id
+
+        low = await submit(priority=0, memory=60)
+        high = await submit(priority=5, memory=50)
+        mid = await submit(priority=1, memory=30)
+        cancelled = await submit(priority=3, memory=10)
+        last = await submit(priority=-1, memory=20)
+        server.cancel(cancelled)
+
+        scheduler = asyncio.create_task(server.schedule())
+        await settle()
+        # 'low' does not fit next to 'high' and 'mid', and blocks 'last' even though it would fit
+        assert list(pool.started) == [high, mid]
+        assert (server.memory_in_use, server.running) == (80, 2)
+
+        pool.started[high].set_exception(RuntimeError("render failed"))
+        await settle()
+        assert list(pool.started) == [high, mid, low]
+        assert server.jobs[high].status == "failed"
+        assert server.memory_in_use == 90
+
+        pool.started[mid].set_result("fingerprint")
+        await settle()
+        assert list(pool.started) == [high, mid, low, last]
+        assert server.jobs[mid].fingerprint == "fingerprint"
+        assert server.memory_in_use == 80
+
+        pool.started[low].set_result("fingerprint")
+        pool.started[last].set_result("fingerprint")
+        await settle()
+        scheduler.cancel()
+        assert (server.memory_in_use, server.running) == (0, 0)
+        assert server.jobs[cancelled].status == "cancelled"
+        assert [server.jobs[job_id].status for job_id in (low, mid, last)] == ["done"] * 3
+
+    asyncio.run(scenario())